@@ -5,12 +5,13 @@
 # - FULL_RW: lettura+scrittura usando service account (gspread)
 #
 # Requisiti:
-# pip install streamlit pandas plotly gspread google-auth openpyxl xlsxwriter
+# pip install streamlit pandas gspread google-auth openpyxl xlsxwriter requests
 
 import streamlit as st
 import pandas as pd
-import io, os, datetime
-import plotly.express as px
+import io, os, json, time, datetime, tempfile
+import requests
+import xlsxwriter
 
 # optional imports for google write access
 try:
@@ -26,21 +27,191 @@ st.set_page_config(page_title="Diario App", layout="centered", initial_sidebar_s
 # Inserisci qui l'ID del Google Sheet (tra /d/ e /edit)
 SHEET_ID = "1VhXmXBx6R-ulSaBNPgHmWTsCp2AHZiKYIMF3IoEyli4"
 
-# URL CSV pubblicabile (read-only)
-SHEET_CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid=0"
-
 # Modalità di default: 'READ_ONLY' o 'FULL_RW'
 MODE = 'READ_ONLY'  # default start: puoi passare a FULL_RW se configuri service-account
 
+# Colonne standard del tuo template
+expected_cols = ["Data","Giorno","Ora","Attività","Materia","Tipo","Stato","Punteggio","Note"]
+
+# Formato della colonna Data nel foglio (gg/mm/aaaa)
+DATE_FORMAT = "%d/%m/%Y"
+
+# Durata cache lettura foglio (secondi); il pulsante "Aggiorna dati" la invalida prima
+CACHE_TTL = 300
+
+# Cartella dello snapshot su disco (parquet + header HTTP): sopravvive al riavvio dell'app
+SNAPSHOT_DIR = tempfile.gettempdir()
+
+# Dopo un download fallito, per questi secondi non si ricontatta Google e si mostra lo snapshot
+FETCH_RETRY_AFTER = 60
+
+# Alias delle intestazioni: sottostringa (minuscola) -> nome standard, nell'ordine in cui vanno provati
+COL_ALIASES = (("data","Data"),("gior","Giorno"),("ora","Ora"),("attiv","Attività"),("mater","Materia"),
+               ("tipo","Tipo"),("stat","Stato"),("punt","Punteggio"),("note","Note"))
+
+# Sottostringhe che identificano le colonne della sezione Missioni
+MISSION_HINTS = ("mission", "descr")
+
+# Colonne a bassa cardinalità tenute come category (un codice intero per riga)
+CATEGORY_COLS = ("Stato", "Materia", "Tipo")
+
+# Colonne rilette prima di salvare per verificare che la riga del foglio sia ancora quella giusta
+SAVE_KEY_COLS = ("Data", "Ora")
+
 # ------------------ HELPERS ------------------
-@st.cache_data(ttl=60)
-def read_sheet_csv(csv_url):
+def _is_mission_col(c):
+    lc = str(c).lower()
+    return any(h in lc for h in MISSION_HINTS)
+
+def _canon(c):
+    # le colonne missioni restano col loro nome (es. "Tipo Missione" non deve diventare "Tipo")
+    if _is_mission_col(c):
+        return c
+    lc = str(c).strip().lower()
+    return next((v for k, v in COL_ALIASES if k in lc), c)
+
+def _canon_names(columns):
+    # intestazioni -> nomi standard, posizione per posizione, senza mai creare duplicati:
+    # i nomi già standard restano (prima occorrenza), gli alias di _canon solo verso nomi non ancora presi
+    # (es. "Statistiche" accanto a "Stato" resta "Statistiche")
+    out = list(columns)
+    taken, assigned = set(), set()
+    for i, c in enumerate(columns):
+        n = str(c).strip()
+        if n in expected_cols and n not in taken:
+            out[i] = n
+            taken.add(n)
+            assigned.add(i)
+    for i, c in enumerate(columns):
+        v = _canon(c)
+        if i not in assigned and v in expected_cols and v not in taken:
+            out[i] = v
+            taken.add(v)
+    return out
+
+def sheet_csv_url(sheet_id):
+    return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid=0"
+
+@st.cache_resource
+def _csv_snapshots():
+    # sheet_id -> (ETag, Last-Modified, DataFrame, istante dell'ultimo errore o None), condiviso tra sessioni
+    return {}
+
+def _snapshot_paths(sheet_id):
+    base = os.path.join(SNAPSHOT_DIR, f"diario_{sheet_id}")
+    return base + ".parquet", base + ".json"
+
+def _read_disk_snapshot(sheet_id):
+    # dopo un riavvio la cache in memoria è vuota: riparte dall'ultimo snapshot salvato, se c'è
+    # restituisce (ETag, Last-Modified, DataFrame, istante di salvataggio)
+    df_path, meta_path = _snapshot_paths(sheet_id)
     try:
-        df = pd.read_csv(csv_url)
-        return df
-    except Exception as e:
-        st.error("Errore nel leggere il foglio via CSV: " + str(e))
-        return pd.DataFrame()
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return meta.get("etag"), meta.get("last_modified"), pd.read_parquet(df_path), meta.get("saved_at", 0)
+    except Exception:
+        return None, None, None, 0
+
+def _write_disk_snapshot(sheet_id, etag, last_mod, df=None):
+    # df=None (risposta 304): il parquet è ancora valido, si aggiorna solo saved_at nei metadati
+    df_path, meta_path = _snapshot_paths(sheet_id)
+    try:
+        if df is not None:
+            df.to_parquet(df_path)
+        with open(meta_path, "w") as f:
+            json.dump({"etag": etag, "last_modified": last_mod, "saved_at": time.time()}, f)
+    except Exception:
+        pass  # disco non scrivibile: si perde solo lo snapshot, non i dati
+
+def fetch_csv(sheet_id):
+    # GET condizionale: se il foglio non è cambiato Google risponde 304 e si riusa l'ultimo DataFrame
+    snapshots = _csv_snapshots()
+    if sheet_id not in snapshots:
+        etag, last_mod, disk_df, saved_at = _read_disk_snapshot(sheet_id)
+        snapshots[sheet_id] = (etag, last_mod, disk_df, None)
+        # snapshot su disco più recente del TTL: vale come la cache in memoria, niente rete
+        if disk_df is not None and time.time() - saved_at < CACHE_TTL:
+            return disk_df
+    etag, last_mod, cached_df, failed_at = snapshots[sheet_id]
+    # errore recente: non si riprova subito (ogni rerun resterebbe fermo fino al timeout);
+    # l'eccezione non viene messa in cache, chi chiama mostra lo snapshot
+    if failed_at is not None and time.time() - failed_at < FETCH_RETRY_AFTER:
+        raise RuntimeError("ultimo download fallito, nuovo tentativo tra poco")
+    headers = {}
+    if cached_df is not None:
+        if etag: headers["If-None-Match"] = etag
+        if last_mod: headers["If-Modified-Since"] = last_mod
+    try:
+        r = requests.get(sheet_csv_url(sheet_id), headers=headers, timeout=10)
+        if r.status_code == 304 and cached_df is not None:
+            snapshots[sheet_id] = (etag, last_mod, cached_df, None)
+            _write_disk_snapshot(sheet_id, etag, last_mod)
+            return cached_df
+        r.raise_for_status()
+    except requests.RequestException:
+        snapshots[sheet_id] = (etag, last_mod, cached_df, time.time())
+        raise
+    # tutte le colonne del foglio: l'export in Esporta deve restare completo, come in FULL_RW
+    df = pd.read_csv(io.StringIO(r.text), dtype=str, on_bad_lines="skip")
+    df = df.set_axis(_canon_names(df.columns), axis=1)
+    snapshots[sheet_id] = (r.headers.get("ETag"), r.headers.get("Last-Modified"), df, None)
+    _write_disk_snapshot(sheet_id, *snapshots[sheet_id][:3])
+    return df
+
+def last_csv_snapshot(sheet_id):
+    # ultimo DataFrame scaricato con successo (in memoria o su disco), None se non c'è
+    snapshots = _csv_snapshots()
+    if sheet_id not in snapshots:
+        snapshots[sheet_id] = _read_disk_snapshot(sheet_id)[:3] + (None,)
+    return snapshots[sheet_id][2]
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_csv(sheet_id: str) -> pd.DataFrame:
+    # cache condivisa tra sessioni, chiave = sheet_id; svuotata da refresh_data()
+    # gli errori vengono rilanciati: st.cache_data non li memorizza; fetch_csv evita di
+    # ricontattare Google per FETCH_RETRY_AFTER secondi dopo un errore
+    return fetch_csv(sheet_id)
+
+@st.cache_data(show_spinner=False)
+def normalize(df_raw: pd.DataFrame, pts: tuple) -> tuple:
+    # rieseguita solo se cambiano i dati del foglio o i punti in sidebar (df hashato per contenuto)
+    # restituisce (df_raw con intestazioni standard, df con Punteggio_calcolato e Data_parsed)
+    # If df_raw has different header names (es. italian variations), try to map common names
+    # (già standard nel caso comune, es. CSV rinominato in fetch_csv: niente rename)
+    if not df_raw.empty and not set(expected_cols).issubset(df_raw.columns):
+        df_raw = df_raw.set_axis(_canon_names(df_raw.columns), axis=1)
+
+    # Guarantee expected columns exist
+    missing = [c for c in expected_cols if c not in df_raw.columns]
+    if missing:
+        df_raw = df_raw.assign(**{c: "" for c in missing})
+    # colonne a bassa cardinalità come category: un codice intero per riga invece di una stringa
+    # (qui e non in fetch_csv, così vale sia per il CSV sia per FULL_RW)
+    df_raw = df_raw.astype({c: "category" for c in CATEGORY_COLS})
+
+    # Compute punt. calcolato
+    df = df_raw.copy()
+    stato = df["Stato"].astype("string").str.strip()
+    score_map = {"✅": pts[0], "⚠️": pts[1], "❌": pts[2]}
+    df["Punteggio_calcolato"] = stato.map(score_map).fillna(0).astype("int16")
+    # datetime64 a mezzanotte; le date non interpretabili diventano NaT invece di bloccare tutta la colonna
+    # prima il formato italiano del template, poi un secondo tentativo (giorno prima del mese) sul resto
+    data = df["Data"].astype("string").str.strip()
+    parsed = pd.to_datetime(data, format=DATE_FORMAT, errors="coerce")
+    rest = parsed.isna() & data.fillna("").ne("")
+    if rest.any():
+        parsed[rest] = pd.to_datetime(data[rest], errors="coerce", dayfirst=True)
+    df["Data_parsed"] = parsed.dt.normalize()
+    return df_raw, df
+
+def _header_cols(header, names):
+    # nome standard -> colonna (1-based) nell'intestazione del foglio, None se assente
+    # stessa regola di rinomina di fetch_csv/normalize (_canon_names)
+    canon = _canon_names(header)
+    return {n: canon.index(n) + 1 if n in canon else None for n in names}
+
+def _cell_text(v):
+    return "" if pd.isna(v) else str(v).strip()
 
 def safe_score_from_state(s):
     if pd.isna(s) or s=="":
@@ -52,15 +223,41 @@ def safe_score_from_state(s):
     return None
 
 # ------------------ AUTH (opzionale) ------------------
-def get_gspread_service(json_path):
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
+          "https://www.googleapis.com/auth/drive"]
+
+@st.cache_resource
+def _gspread_client(json_bytes: bytes):
     # restituisce client gspread autenticato se GS_AVAILABLE True
+    # chiave = contenuto del JSON: ricaricare un'altra service account crea un nuovo client
     if not GS_AVAILABLE:
         raise RuntimeError("gspread non installato o import fallito.")
-    scopes = ["https://www.googleapis.com/auth/spreadsheets",
-              "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(json_path, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client
+    creds = Credentials.from_service_account_info(json.loads(json_bytes), scopes=SCOPES)
+    return gspread.authorize(creds)
+
+@st.cache_resource
+def _worksheet(sheet_id: str, json_bytes: bytes):
+    # worksheet riutilizzato tra rerun: niente nuova autenticazione ad ogni salvataggio
+    return _gspread_client(json_bytes).open_by_key(sheet_id).sheet1
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_gspread(sheet_id: str, json_bytes: bytes) -> pd.DataFrame:
+    # una sola chiamata values.get per tutto il foglio; stessa chiave di cache di load_csv
+    ws = _worksheet(sheet_id, json_bytes)
+    values = ws.get_all_values()
+    if not values:
+        return pd.DataFrame()
+    return pd.DataFrame(values[1:], columns=values[0])
+
+def refresh_data():
+    # la cache di lettura è condivisa da tutte le sessioni: un contatore per sessione non basta a invalidarla
+    load_csv.clear()
+    load_gspread.clear()
+    # richiesta esplicita: si riprova il download anche se l'ultimo tentativo era fallito
+    snapshots = _csv_snapshots()
+    for k, v in snapshots.items():
+        snapshots[k] = v[:3] + (None,)
+    st.session_state.pop("sheet_cols", None)
 
 # ------------------ UI SIDEBAR ------------------
 st.sidebar.markdown("**Diario App — Impostazioni**")
@@ -68,29 +265,38 @@ mode_select = st.sidebar.radio("Modalità operativa", options=["READ_ONLY", "FUL
 points_complete = st.sidebar.number_input("Punti per ✅", min_value=1, max_value=100, value=10)
 points_partial  = st.sidebar.number_input("Punti per ⚠️", min_value=0, max_value=100, value=5)
 points_missed   = st.sidebar.number_input("Punti per ❌", min_value=0, max_value=100, value=0)
+if st.sidebar.button("🔄 Aggiorna dati"):
+    refresh_data()
 st.sidebar.markdown("---")
 st.sidebar.caption("Diario App — mobile-first. Apri in Safari e 'Aggiungi alla schermata Home' per esperienza app-like.")
 
 # ------------------ LOAD DATA ------------------
 mode = mode_select
+gsa_bytes = None
 if mode == "READ_ONLY":
-    df_raw = read_sheet_csv(SHEET_CSV_URL)
+    try:
+        df_raw = load_csv(SHEET_ID)
+    except Exception as e:
+        df_raw = last_csv_snapshot(SHEET_ID)
+        if df_raw is not None:
+            st.warning("Foglio non raggiungibile (" + str(e) + "): mostro l'ultimo snapshot salvato.")
+        else:
+            st.error("Errore nel leggere il foglio via CSV: " + str(e))
+            df_raw = pd.DataFrame()
 else:
     # FULL_RW: user can upload service account JSON in sidebar or set STREAMLIT secrets
     st.sidebar.markdown("Modalità FULL_RW: carica il file JSON della Service Account o aggiungilo come secret 'GSA_JSON' su Streamlit Cloud.")
     gsa_file = st.sidebar.file_uploader("Carica service-account.json", type=['json'])
     if gsa_file is not None:
-        # salva temporaneamente
-        with open("service_account.json", "wb") as f:
-            f.write(gsa_file.getbuffer())
-        json_path = "service_account.json"
+        # resta in memoria: nessun file service_account.json scritto su disco
+        gsa_bytes = gsa_file.getvalue()
         try:
-            client = get_gspread_service(json_path)
-            sh = client.open_by_key(SHEET_ID)
-            # legge il primo sheet come dataframe
-            ws = sh.sheet1
-            data = ws.get_all_records()
-            df_raw = pd.DataFrame(data)
+            # legge il primo sheet come dataframe (cache condivisa, vedi load_gspread)
+            df_raw = load_gspread(SHEET_ID, gsa_bytes)
+            if "sheet_cols" not in st.session_state:
+                # colonne (1-based) secondo l'intestazione reale del foglio, lette una volta per sessione
+                header = _worksheet(SHEET_ID, gsa_bytes).row_values(1)
+                st.session_state["sheet_cols"] = _header_cols(header, SAVE_KEY_COLS + ("Stato",))
         except Exception as e:
             st.error("Errore autenticazione Google: " + str(e))
             df_raw = pd.DataFrame()
@@ -99,32 +305,7 @@ else:
         df_raw = pd.DataFrame()
 
 # ------------------ DATA NORMALIZATION ------------------
-# Tentativi per normalizzare colonne standard del tuo template:
-expected_cols = ["Data","Giorno","Ora","Attività","Materia","Tipo","Stato","Punteggio","Note"]
-# If df_raw has different header names (es. italian variations), try to map common names
-col_map = {}
-for c in df_raw.columns if not df_raw.empty else []:
-    lc = c.strip().lower()
-    if "data" in lc: col_map[c] = "Data"
-    elif "gior" in lc: col_map[c] = "Giorno"
-    elif "ora" in lc: col_map[c] = "Ora"
-    elif "attiv" in lc: col_map[c] = "Attività"
-    elif "mater" in lc: col_map[c] = "Materia"
-    elif "tipo" in lc: col_map[c] = "Tipo"
-    elif "stat" in lc: col_map[c] = "Stato"
-    elif "punt" in lc: col_map[c] = "Punteggio"
-    elif "note" in lc: col_map[c] = "Note"
-if col_map:
-    df_raw = df_raw.rename(columns=col_map)
-
-# Guarantee expected columns exist
-for c in expected_cols:
-    if c not in df_raw.columns:
-        df_raw[c] = ""
-
-# Compute punt. calcolato
-df = df_raw.copy()
-df["Punteggio_calcolato"] = df["Stato"].apply(lambda s: points_complete if str(s).strip()=="✅" else (points_partial if str(s).strip()=="⚠️" else (points_missed if str(s).strip()=="❌" else 0)))
+df_raw, df = normalize(df_raw, (points_complete, points_partial, points_missed))
 
 # ------------------ LAYOUT MOBILE ------------------
 st.markdown("<h1 style='text-align:center'>📔 Diario App</h1>", unsafe_allow_html=True)
@@ -141,76 +322,128 @@ cols[2].metric("Modalità", mode)
 
 st.markdown("---")
 
+# ------------------ SEZIONI ------------------
+# Grafico ed export sono fragment: i loro widget rieseguono solo la propria sezione, non tutto lo script
+@st.cache_data(show_spinner=False)
+def daily_points(points):
+    # points = colonne Data_parsed/Punteggio_calcolato; la cache è indicizzata sul loro contenuto
+    # resample giornaliero: output già ordinato e senza buchi (giorni vuoti = 0 punti)
+    return points.dropna(subset=["Data_parsed"]).resample("D", on="Data_parsed")["Punteggio_calcolato"].sum().reset_index()
+
+@st.fragment
+def _chart_section(df):
+    # Statistiche: grafico punti giornalieri
+    st.markdown("## 📈 Andamento punti giornalieri")
+    daily = daily_points(df[["Data_parsed", "Punteggio_calcolato"]])
+    if not daily.empty:
+        # grafico nativo (vega-lite): i dati viaggiano come tabella Arrow, più leggera del JSON plotly
+        st.line_chart(daily, x="Data_parsed", y="Punteggio_calcolato", x_label="Data", y_label="Punti giornalieri")
+    else:
+        st.info("Nessun dato per grafico punti.")
+
+@st.fragment
+def _export_section(df_raw):
+    # Export: CSV subito disponibile, xlsx solo su richiesta (solo client-side)
+    st.markdown("### ⬇️ Esporta")
+    st.download_button("Scarica snapshot CSV (.csv)", data=df_raw.to_csv(index=False).encode("utf-8"), file_name="DiarioApp_snapshot.csv", mime="text/csv")
+    to_export = st.button("Prepara snapshot Excel (.xlsx)")
+    if to_export:
+        bio = io.BytesIO()
+        # constant_memory: xlsxwriter scrive riga per riga senza tenere in memoria tutta la griglia.
+        # Richiede scrittura per righe, quindi niente df.to_excel (pandas scrive per colonne)
+        wb = xlsxwriter.Workbook(bio, {"constant_memory": True})
+        sheet = wb.add_worksheet("Sheet1")
+        sheet.write_row(0, 0, [str(c) for c in df_raw.columns])
+        rows = df_raw.astype(object).where(df_raw.notna(), None).itertuples(index=False, name=None)
+        for r, values in enumerate(rows, start=1):
+            sheet.write_row(r, 0, values)
+        wb.close()
+        bio.seek(0)
+        st.download_button("Clicca per scaricare il file .xlsx", data=bio, file_name="DiarioApp_snapshot.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+tab_oggi, tab_missioni, tab_andamento, tab_esporta = st.tabs(["Oggi", "Missioni", "Andamento", "Esporta"])
+
 # Pagina: Oggi -> mostra righe relative alla data odierna (se la colonna Data è data)
-# Pagina: Oggi -> mostra righe relative alla data odierna (se la colonna Data è data)
-try:
-    df["Data_parsed"] = pd.to_datetime(df["Data"]).dt.date
-except Exception:
-    df["Data_parsed"] = df["Data"]
+today_ts = pd.Timestamp(today)
+oggi_df = df[df["Data_parsed"] == today_ts]
+with tab_oggi:
+    if oggi_df.empty:
+        st.info("Nessuna riga per oggi trovata nel foglio. Puoi comunque esplorare il planner generale nelle altre tab.")
+    else:
+        st.markdown("## ⏱️ Oggi — ora per ora")
+        stati = ["","✅","⚠️","❌"]
+        cols_to_show = ["Ora","Attività","Materia","Tipo","Stato","Punteggio_calcolato","Note"]
+        # l'indice resta quello di df: serve per ricavare la riga del foglio al salvataggio
+        oggi_view = oggi_df[cols_to_show].copy()
+        # st.data_editor non accetta nomi di colonna duplicati: _canon_names non ne crea,
+        # ma il foglio stesso può avere due intestazioni identiche
+        oggi_view = oggi_view.loc[:, ~oggi_view.columns.duplicated()]
+        oggi_view["Stato"] = oggi_view["Stato"].astype("string").str.strip().fillna("")
+        # Un solo widget tabellare dentro un form: nessun rerun finché non si preme "Salva tutto"
+        with st.form("oggi_form"):
+            edited = st.data_editor(
+                oggi_view,
+                column_config={
+                    "Stato": st.column_config.SelectboxColumn("Stato", options=stati),
+                    "Punteggio_calcolato": st.column_config.NumberColumn("Punteggio"),
+                },
+                disabled=[c for c in cols_to_show if c != "Stato"],
+                hide_index=True,
+                num_rows="fixed",
+                key="oggi_editor",
+            )
+            submitted = st.form_submit_button("Salva tutto")
 
-oggi_df = df[df["Data_parsed"] == today]
-if oggi_df.empty:
-    st.info("Nessuna riga per oggi trovata nel foglio. Puoi comunque esplorare il planner generale qui sotto.")
-else:
-    st.markdown("## ⏱️ Oggi — ora per ora")
-    # Elenco compatto verticale stile card
-    for i, row in oggi_df.reset_index().iterrows():
-        with st.container():
-            st.markdown(f"**{row['Ora']} — {row['Attività'] or '—'}**")
-            st.markdown(f"Materia: *{row['Materia']}*  •  Tipo: `{row['Tipo']}`")
-            st.caption(f"Note: {row['Note']}")
-            cols = st.columns([1,1,1,2])
-            state = row['Stato'] if row['Stato'] else ""
-            new_state = cols[0].selectbox("Stato", options=["","✅","⚠️","❌"], index=0, key=f"st_{i}")
-            if cols[1].button("Salva", key=f"save_{i}"):
-                # Solo modalità FULL_RW con service account salva su Google
-                if mode == "FULL_RW" and GS_AVAILABLE and os.path.exists("service_account.json"):
-                    try:
-                        client = get_gspread_service("service_account.json")
-                        sh = client.open_by_key(SHEET_ID)
-                        ws = sh.sheet1
-                        # find row index in sheet via searching for Data+Ora matching (simple heuristic)
-                        all_values = ws.get_all_records()
-                        for r_idx, rec in enumerate(all_values, start=2):
-                            if str(rec.get('Data','')) == str(row['Data']) and str(rec.get('Ora','')) == str(row['Ora']):
-                                ws.update_cell(r_idx, list(df.columns).index("Stato")+1, new_state)
-                                st.success("✅ Stato aggiornato su Google Sheet")
-                                break
-                        else:
-                            st.warning("Non ho trovato la riga corrispondente per aggiornare.")
-                    except Exception as e:
-                        st.error("Errore scrittura Google: " + str(e))
-                else:
-                    st.warning("Per salvare su Google Sheet attiva FULL_RW e carica il JSON service account nella sidebar.")
-            cols[2].markdown(f"**Punteggio:** {row['Punteggio_calcolato'] or 0}")
-# Missioni: ricava da sheet le eventuali missioni (se esiste una tabella 'Missioni')
-# For simplicity: cerca foglio missioni via CSV non è semplice; qui visualizziamo una sezione sintetica.
-st.markdown("## 🎯 Missioni (sintesi)")
-# If the sheet contains columns 'Tipo Missione' and 'Descrizione' show them
-possible_mission_cols = [c for c in df_raw.columns if 'mission' in c.lower() or 'descr' in c.lower()]
-if len(possible_mission_cols) >= 1:
-    st.dataframe(df_raw[possible_mission_cols].head())
-else:
-    st.info("Missioni non trovate nel foglio. Le puoi gestire direttamente nella tab Missioni del Google Sheet.")
-
-# Statistiche: grafico punti giornalieri
-st.markdown("## 📈 Andamento punti giornalieri")
-daily = df.groupby("Data_parsed")["Punteggio_calcolato"].sum().reset_index().sort_values("Data_parsed")
-if not daily.empty:
-    fig = px.line(daily, x="Data_parsed", y="Punteggio_calcolato", title="Punti giornalieri", markers=True)
-    st.plotly_chart(fig, use_container_width=True)
-else:
-    st.info("Nessun dato per grafico punti.")
+        if submitted:
+            new_stato = edited["Stato"].fillna("")
+            changed = new_stato[new_stato != oggi_view["Stato"]]
+            changes = list(changed.items())
+            sheet_cols = st.session_state.get("sheet_cols", {})
+            if not changes:
+                st.info("Nessuna modifica da salvare.")
+            # Solo modalità FULL_RW con service account salva su Google
+            elif mode == "FULL_RW" and GS_AVAILABLE and gsa_bytes is not None and not all(sheet_cols.get(c) for c in SAVE_KEY_COLS + ("Stato",)):
+                st.warning("Colonne Data, Ora o Stato non trovate nell'intestazione del foglio: impossibile salvare.")
+            elif mode == "FULL_RW" and GS_AVAILABLE and gsa_bytes is not None:
+                try:
+                    ws = _worksheet(SHEET_ID, gsa_bytes)
+                    # riga nel foglio = indice del dataframe + 2 (header in riga 1, indici da 0)
+                    rows = [int(idx) + 2 for idx, _ in changes]
+                    # i dati in cache possono essere vecchi: se nel frattempo righe sono state inserite,
+                    # cancellate o ordinate, Data/Ora non coincidono più e non si scrive nulla
+                    check = ws.batch_get([gspread.utils.rowcol_to_a1(r, sheet_cols[c]) for r in rows for c in SAVE_KEY_COLS])
+                    found = [_cell_text(vr.first("")) for vr in check]
+                    expected = [_cell_text(oggi_df.at[idx, c]) for idx, _ in changes for c in SAVE_KEY_COLS]
+                    if found != expected:
+                        refresh_data()
+                        st.warning("Il foglio è cambiato dall'ultima lettura: nessuno stato salvato. Controlla i dati aggiornati e riprova.")
+                    else:
+                        body = [{"range": gspread.utils.rowcol_to_a1(r, sheet_cols["Stato"]), "values": [[new_state]]}
+                                for r, (_, new_state) in zip(rows, changes)]
+                        ws.batch_update(body, value_input_option="USER_ENTERED")
+                        # invalida la cache di lettura così il prossimo rerun mostra i nuovi stati
+                        refresh_data()
+                        st.success(f"✅ {len(body)} stati aggiornati su Google Sheet")
+                except Exception as e:
+                    st.error("Errore scrittura Google: " + str(e))
+            else:
+                st.warning("Per salvare su Google Sheet attiva FULL_RW e carica il JSON service account nella sidebar.")
 
-# Export: scarica xlsx aggiornato (solo client-side)
-st.markdown("---")
-st.markdown("### ⬇️ Esporta")
-to_export = st.button("Scarica snapshot Excel (.xlsx)")
-if to_export:
-    bio = io.BytesIO()
-    with pd.ExcelWriter(bio, engine="xlsxwriter", datetime_format='yyyy-mm-dd') as writer:
-        df_raw.to_excel(writer, sheet_name="Sheet1", index=False)
-    bio.seek(0)
-    st.download_button("Clicca per scaricare il file .xlsx", data=bio, file_name="DiarioApp_snapshot.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+with tab_missioni:
+    # Missioni: ricava da sheet le eventuali missioni (se esiste una tabella 'Missioni')
+    # For simplicity: cerca foglio missioni via CSV non è semplice; qui visualizziamo una sezione sintetica.
+    st.markdown("## 🎯 Missioni (sintesi)")
+    # If the sheet contains columns 'Tipo Missione' and 'Descrizione' show them
+    possible_mission_cols = [c for c in df_raw.columns if _is_mission_col(c)]
+    if len(possible_mission_cols) >= 1:
+        st.dataframe(df_raw[possible_mission_cols].head())
+    else:
+        st.info("Missioni non trovate nel foglio. Le puoi gestire direttamente nella tab Missioni del Google Sheet.")
+
+with tab_andamento:
+    _chart_section(df)
+
+with tab_esporta:
+    _export_section(df_raw)
 
 st.markdown("— fine —")